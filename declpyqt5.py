@@ -20,21 +20,99 @@
 # SOFTWARE.
 
 import enum
+import itertools
 import PyQt5.QtCore
 import PyQt5.QtWidgets
-from typing import List, Dict, Any, Union, Callable
-import uuid
+import PyQt5.sip
+from typing import List, Dict, Any, Union, Callable, Optional
+import weakref
+
+
+# stands for an argument that was not given, where None is a valid value
+_unset = object()
 
 
 class BuildContext:
     """ This shares the state between widgets. """
     def __init__(self, application):
         self._application = application
+        self._dirty = False
+        self._scheduled = False
+        self._stale = []
+        # live InheritedWidgets by type
+        self._slices = {}
+        # [(initial value, value set through setState())] by InheritedWidget
+        # type, so that the latter outlives the InheritedWidgets built with the
+        # former
+        self._values = {}
+        # InheritedWidgets and Builders enclosing the widget being built
+        self._inherited = []
+        self._building = []
         self.counter = 0
 
-    def setState(self):
-        if self._application:
-            self._application.setState()
+    def setState(self, slice: type = None, value: Any = _unset):
+        """ Rebuilds the widget tree. If an InheritedWidget type is given as
+        the slice, only the Builders depending on it are rebuilt, after the
+        value (if given any) has been passed to it and updateShouldNotify()
+        agreed. The value is kept for later builds as well, as long as they
+        pass the same initial value to the InheritedWidget. """
+        if slice is None:
+            self.markNeedsBuild()
+            return
+        live = list(self._slices.get(slice, ()))
+        if value is not _unset:
+            self._values[slice] = [(i._initial, value) for i in live]
+        for inherited in live:
+            if value is not _unset:
+                old = inherited._value
+                inherited._value = value
+                if not inherited.updateShouldNotify(old):
+                    continue
+            for dependent in inherited._dependents:
+                self.markNeedsBuild(dependent)
+        return
+
+    def dependOnInheritedWidgetOfExactType(self, widgetType: type) -> Any:
+        """ Returns the nearest enclosing InheritedWidget of exactly this type,
+        or None. The Builder being built then depends on it, to be rebuilt
+        whenever its slice of the state changes. """
+        for inherited in reversed(self._inherited):
+            if type(inherited) is widgetType:
+                if self._building:
+                    inherited._dependents.add(self._building[-1])
+                return inherited
+        return None
+
+    def markNeedsBuild(self, builder: Any = None) -> None:
+        """ Schedules the application (or only the Builder given) to rebuild
+        once control returns to the event loop, so that all requests made
+        until then share a single rebuild. """
+        if builder is None:
+            self._dirty = True
+        else:
+            self._stale.append(builder)
+        if self._scheduled:
+            return
+        if PyQt5.QtCore.QCoreApplication.instance() is None:
+            # no event loop to wait for
+            self._flush()
+            return
+        self._scheduled = True
+        PyQt5.QtCore.QTimer.singleShot(0, self._flush)
+        return
+
+    def _flush(self) -> None:
+        self._scheduled = False
+        stale, self._stale = self._stale, []
+        if self._dirty:
+            self._dirty = False
+            if self._application:
+                self._application.setState()
+            return
+        # outer builders first, they may well rebuild the inner ones
+        for builder in sorted(set(stale), key=lambda b: len(b._scope[1])):
+            builder.rebuild()
+        return
     pass
 
 
@@ -46,6 +124,9 @@ class Key:
 
     def __eq__(self, other) -> bool:
         return True
+
+    def __hash__(self) -> int:
+        return 0
     pass
 
 
@@ -59,38 +140,54 @@ class ValueKey(Key):
         if not isinstance(other, ValueKey):
             return False
         return self._value == other._value
+
+    def __hash__(self) -> int:
+        return hash((ValueKey, self._value))
     pass
 
 
 class UniqueKey(Key):
     """ All UniqueKeys are different. """
+    _counter = itertools.count()
+
     def __init__(self):
-        self._hash = uuid.uuid4()
+        self._hash = next(UniqueKey._counter)
         return
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, UniqueKey):
             return False
         return self._hash == other._hash
+
+    def __hash__(self) -> int:
+        return self._hash
     pass
 
 
 class Widget:
+    __slots__ = ('_key', '_context', '_hash', '_widget', '__weakref__')
+    # distinguishes the hashes of different widget classes
+    _TAG = 0
+    _hash_counter = itertools.count()
+
     def __init__(self, key: Key = Key()):
         """ This is where the initial parameters are loaded. """
         self._key = key
         self._context = None
-        self._hash = 0
+        # unique until a subclass hashes what it shows, so that it can never
+        # pass for unchanged by mistake
+        self._hash = hash((Widget._TAG, next(Widget._hash_counter)))
+        self._widget = None
         return
 
     def build(self, context: BuildContext) -> None:
         """ This will be called when the widget tree is expanded to a large
         and full widget tree. Nothing natively related should be done here.
         Also, you are expected to update your hash in this function, so as to
-        determine the differentiation between different build()s. Note that you
-        are not required to return anything, just build the tree. """
+        determine the differentiation between different build()s, unless it
+        was already settled at construction time. Note that you are not
+        required to return anything, just build the tree. """
         self._context = context
-        self._hash = 0
         return
 
     def paintWidget(self) -> Any:
@@ -99,92 +196,288 @@ class Widget:
         widget from here for upper level functions to work. """
         return
 
+    def updateWidget(self, old: 'Widget', widget: Any) -> Any:
+        """ This will be called when the widget tree is rebuilt, and `old`, a
+        widget of the same type but a different hash, had painted `widget`.
+        `old` may also be this very widget, kept in the tree and built again
+        in place. You are expected to update that Qt widget in place and
+        return it, or return a freshly painted Qt widget to replace it. """
+        return self.paintWidget()
+
+    def adoptWidget(self, old: 'Widget', widget: Any) -> None:
+        """ This will be called when the widget tree is rebuilt, and `old`, a
+        widget of the same type and hash, had painted `widget`. Nothing
+        visible should change here, just take over the Qt widget (and those
+        of the children, if there were any). It is only called for classes
+        that override it, others are updated (by default repainted) instead.
+        """
+        self._widget = widget
+        return
+
+    def disposeWidget(self, widget: Any) -> None:
+        """ This will be called when `widget`, which had been painted for this
+        widget, is dropped from the Qt widget tree. By default it is simply
+        deleted. """
+        widget.deleteLater()
+        return
+
     def setState(self) -> None:
         """ This calls the application to repaint the widget tree, updating
         widgets if necessary. """
         if self._context is None:
             print('attempted setState() on an unbuilt widget')
-        self._context.repaint()
+            return
+        self._context.markNeedsBuild()
         return
     pass
 
 
+# live leaf widgets by (class, constructor arguments), see _intern()
+_intern_cache: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+
+def _intern(cls: type, key: Key, args: tuple) -> Widget:
+    """ Returns the live instance of `cls` constructed from `args`, so that
+    structurally equal leaf widgets are one and the same object, or else a
+    blank (not yet initialized) instance. Widgets carrying a specific key
+    or a callback are never shared: the callback could well reach the widget
+    (through its closure) and keep the cache entry alive forever. """
+    if type(key) is not Key:
+        return object.__new__(cls)
+    if any(callable(arg) for arg in args):
+        return object.__new__(cls)
+    try:
+        instance = _intern_cache.get((cls, args))
+    except TypeError:
+        # unhashable arguments
+        return object.__new__(cls)
+    if instance is None:
+        instance = object.__new__(cls)
+        _intern_cache[(cls, args)] = instance
+    return instance
+
+
+# interned leaves keeping a dropped Qt widget (see disposeWidget()) during the
+# reconcile pass under way
+_spares: List[Widget] = []
+
+
+def _dropSpares() -> None:
+    """ Deletes the Qt widgets dropped during the reconcile pass that just
+    ended and not painted again since. """
+    for owner in _spares:
+        if owner._spare is not None:
+            owner._spare.deleteLater()
+            owner._spare = None
+    _spares.clear()
+    return
+
+
+def _reconcileWidget(old: Widget, new: Widget, widget: Any) -> Any:
+    """ Returns the Qt widget presenting `new`, reusing `widget` (which had
+    been painted for `old`) wherever possible. """
+    if old is new:
+        if type(new).build is Widget.build:
+            # a leaf settled at construction, it still shows what it painted
+            return widget
+        # build() may have changed it in place, e.g. a Builder its child
+        return new.updateWidget(old, widget)
+    if type(old) is not type(new):
+        return new.paintWidget()
+    if old._hash == new._hash and \
+            type(new).adoptWidget is not Widget.adoptWidget:
+        new.adoptWidget(old, widget)
+        return widget
+    return new.updateWidget(old, widget)
+
+
+def _reconcile(old: Widget, new: Widget, layout: Any, index: int) -> Any:
+    """ Reconciles the Qt widget at `index` of `layout` from `old` to `new`,
+    replacing it in the layout only if it could not be reused. """
+    widget = layout.itemAt(index).widget()
+    replacement = _reconcileWidget(old, new, widget)
+    if replacement is not widget:
+        layout.replaceWidget(widget, replacement)
+        old.disposeWidget(widget)
+    return replacement
+
+
+def _rebind(signal: Any, old: Callable, new: Callable) -> None:
+    """ Moves a connection of `signal` from slot `old` to slot `new`. """
+    if old == new:
+        return
+    if old is not None:
+        signal.disconnect(old)
+    if new is not None:
+        signal.connect(new)
+    return
+
+
 class Text(Widget):
     """ Text label. """
+    __slots__ = ('_text', '_spare')
+    _TAG = 1
+
+    def __new__(cls, text: str, key: Key = Key()):
+        if text is None:
+            text = ''
+        return _intern(cls, key, (text,))
+
     def __init__(self, text: str, key: Key = Key()):
+        if hasattr(self, '_hash'):
+            return  # interned, already initialized
         super(Text, self).__init__(key)
         if text is None:
             text = ''
         self._text = text
-        return
-
-    def build(self, context: BuildContext):
-        super(Text, self).build(context)
-        self._hash = hash('Text(text=%s)' % self._text)
+        self._hash = hash((Text._TAG, self._text))
+        self._spare = None
         return
 
     def paintWidget(self) -> Any:
+        if self._spare is not None:
+            self._widget, self._spare = self._spare, None
+            return self._widget
         self._widget = PyQt5.QtWidgets.QLabel(self._text)
         return self._widget
+
+    def disposeWidget(self, widget: Any) -> None:
+        # interned, so painting it again in this pass may pick it up
+        if self._spare is not None:
+            return super(Text, self).disposeWidget(widget)
+        widget.setParent(None)
+        self._spare = widget
+        _spares.append(self)
+        return
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = widget
+        self._widget.setText(self._text)
+        return self._widget
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        # the same text, and no signals to move
+        super(Text, self).adoptWidget(old, widget)
+        return
     pass
 
 
 class LabelButton(Widget):
     """ Clickable labeled button. """
+    __slots__ = ('_label', '_tooltip', '_ontap', '_spare')
+    _TAG = 2
+
+    def __new__(cls, key: Key = Key(), label: str = '', tooltip: str = '',
+                onTap: Callable = None):
+        return _intern(cls, key, (label, tooltip, onTap))
+
     def __init__(self, key: Key = Key(), label: str = '', tooltip: str = '',
                  onTap: Callable = None):
+        if hasattr(self, '_hash'):
+            return  # interned, already initialized
         super(LabelButton, self).__init__(key)
         self._label = label
         self._tooltip = tooltip
         self._ontap = onTap
-        return
-
-    def build(self, context: BuildContext):
-        super(LabelButton, self).build(context)
-        self._hash = hash('LabelButton(label=%s,tooltip=%s,onTap=%s)' % (
-            self._label, self._tooltip, type(self._ontap)))
+        self._hash = hash((LabelButton._TAG, self._label, self._tooltip,
+                           type(self._ontap)))
+        self._spare = None
         return
 
     def paintWidget(self) -> Any:
+        if self._spare is not None:
+            self._widget, self._spare = self._spare, None
+            return self._widget
         self._widget = PyQt5.QtWidgets.QPushButton(self._label)
         self._widget.setToolTip(self._tooltip)
         if self._ontap is not None:
             self._widget.clicked.connect(self._ontap)
         return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = widget
+        self._widget.setText(self._label)
+        self._widget.setToolTip(self._tooltip)
+        _rebind(self._widget.clicked, old._ontap, self._ontap)
+        return self._widget
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        super(LabelButton, self).adoptWidget(old, widget)
+        _rebind(self._widget.clicked, old._ontap, self._ontap)
+        return
+
+    def disposeWidget(self, widget: Any) -> None:
+        # interned, so painting it again in this pass may pick it up
+        if self._spare is not None:
+            return super(LabelButton, self).disposeWidget(widget)
+        widget.setParent(None)
+        self._spare = widget
+        _spares.append(self)
+        return
     pass
 
 
 class TextField(Widget):
     """ Text field allowing entering text. """
+    __slots__ = ('_placeholder', '_value', '_hidden', '_onchanged')
+    _TAG = 3
+
+    def __new__(cls, key: Key = Key(), placeholder: str = '',
+                value: str = '', hidden: bool = False,
+                onChanged: Callable[[str], None] = None):
+        return _intern(cls, key, (placeholder, value, hidden, onChanged))
+
     def __init__(self, key: Key = Key(), placeholder: str = '',
                  value: str = '', hidden: bool = False,
                  onChanged: Callable[[str], None] = None):
+        if hasattr(self, '_hash'):
+            return  # interned, already initialized
         super(TextField, self).__init__(key)
         self._placeholder = placeholder
         self._value = value
         self._onchanged = onChanged
         self._hidden = hidden
-        return
-
-    def build(self, context: BuildContext):
-        super(TextField, self).build(context)
-        self._hash = hash(
-            'TextField(placeholder=%s,hidden=%s,onChanged=%s)' %
-            (self._placeholder, self._hidden, type(self._onchanged)))
+        self._hash = hash((TextField._TAG, self._placeholder, self._value,
+                           self._hidden, type(self._onchanged)))
         return
 
     def paintWidget(self) -> Any:
         self._widget = PyQt5.QtWidgets.QLineEdit()
+        self._widget.setPlaceholderText(self._placeholder)
         self._widget.setText(self._value)
         if self._hidden:
             self._widget.setEchoMode(PyQt5.QtWidgets.QLineEdit.Password)
-        self._widget.textChanged.connect(self._onchanged)
+        if self._onchanged is not None:
+            self._widget.textChanged.connect(self._onchanged)
+        return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = widget
+        self._widget.setPlaceholderText(self._placeholder)
+        # the user may have typed since, only reset what differs
+        if self._widget.text() != self._value:
+            self._widget.blockSignals(True)
+            self._widget.setText(self._value)
+            self._widget.blockSignals(False)
+        if self._hidden:
+            self._widget.setEchoMode(PyQt5.QtWidgets.QLineEdit.Password)
+        else:
+            self._widget.setEchoMode(PyQt5.QtWidgets.QLineEdit.Normal)
+        _rebind(self._widget.textChanged, old._onchanged, self._onchanged)
         return self._widget
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        super(TextField, self).adoptWidget(old, widget)
+        _rebind(self._widget.textChanged, old._onchanged, self._onchanged)
+        return
     pass
 
 
 class Expanded(Widget):
     """ Expandeds widget to flex in order to fit it inside AxisAlignedBox. """
+    __slots__ = ('_child', '_flex')
+    _TAG = 4
+
     def __init__(self, key: Key = Key(), child: Widget = None, flex: int = 1):
         super(Expanded, self).__init__(key)
         if child is None:
@@ -198,13 +491,20 @@ class Expanded(Widget):
     def build(self, context: BuildContext):
         super(Expanded, self).build(context)
         self._child.build(context)
-        self._hash = hash('Expanded(child=%s,flex=%d)' % (
-            self._child._hash, self._flex))
+        self._hash = hash((Expanded._TAG, self._child._hash, self._flex))
         return
 
     def paintWidget(self) -> Any:
         self._widget = self._child.paintWidget()
         return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = _reconcileWidget(old._child, self._child, widget)
+        return self._widget
+
+    def disposeWidget(self, widget: Any) -> None:
+        self._child.disposeWidget(widget)
+        return
     pass
 
 
@@ -217,28 +517,24 @@ class Alignment(enum.Enum):
 
 class AxisAlignedBox(Widget):
     """ Vertical or horizontal alignment. """
-    def __init__(self, key: Key = Key(), children: List[Widget] = [],
+    __slots__ = ('_children', '_vertical', '_layout', '_widgets')
+    _TAG = 5
+
+    def __init__(self, key: Key = Key(),
+                 children: Optional[List[Widget]] = None,
                  vertical: bool = True, alignment: Alignment = Alignment.none):
         super(AxisAlignedBox, self).__init__(key)
-        self._children = []
-        # stat expanded
-        has_expanded = False
-        for child in children:
-            if child is not None:
-                if isinstance(child, Expanded):
-                    has_expanded = True
+        if children is None:
+            children = ()
+        children = [child for child in children if child is not None]
         # fake alignment
-        if not has_expanded:
+        before, after = (), ()
+        if not any(isinstance(child, Expanded) for child in children):
             if alignment in {Alignment.center, Alignment.end}:
-                self._children.append(Expanded(child=Text(''), flex=1))
-        # add children
-        for child in children:
-            if child is not None:
-                self._children.append(child)
-        # fake alignment
-        if not has_expanded:
+                before = (Expanded(child=Text(''), flex=1),)
             if alignment in {Alignment.start, Alignment.center}:
-                self._children.append(Expanded(child=Text(''), flex=1))
+                after = (Expanded(child=Text(''), flex=1),)
+        self._children = [*before, *children, *after]
         self._vertical = vertical
         return
 
@@ -246,8 +542,8 @@ class AxisAlignedBox(Widget):
         super(AxisAlignedBox, self).build(context)
         for child in self._children:
             child.build(context)
-        self._hash = hash('AxisAlignedBox(children=[%s])' % ','.join(map(
-            lambda child: str(child._hash), self._children)))
+        self._hash = hash((self._TAG, self._vertical, tuple(
+            child._hash for child in self._children)))
         return
 
     def paintWidget(self) -> Any:
@@ -257,168 +553,493 @@ class AxisAlignedBox(Widget):
             self._layout = PyQt5.QtWidgets.QHBoxLayout()
         self._widget = PyQt5.QtWidgets.QWidget()
         self._widgets = []
-        flexes = []
         for child in self._children:
             widget = child.paintWidget()
-            self._layout.addWidget(widget)
-            self._widgets.append(widget)
             if isinstance(child, Expanded):
                 flex = child._flex
             else:
                 flex = 0
-            flexes.append(flex)
-        for i, flex in enumerate(flexes):
-            self._layout.setStretch(i, flex)
+            self._layout.addWidget(widget, flex)
+            self._widgets.append(widget)
         self._widget.setLayout(self._layout)
         return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        if self._vertical != old._vertical:
+            return self.paintWidget()
+        self._widget = widget
+        self._layout = widget.layout()
+        self._widgets = []
+        previous = [self._layout.itemAt(i).widget()
+                    for i in range(len(old._children))]
+        # keyed children follow their key, the others go in order
+        keyed = {}
+        unkeyed = []
+        for i, child in enumerate(old._children):
+            if isinstance(child._key, (ValueKey, UniqueKey)):
+                keyed.setdefault(child._key, i)
+            else:
+                unkeyed.append(i)
+        unkeyed = iter(unkeyed)
+        matches = []
+        for child in self._children:
+            if isinstance(child._key, (ValueKey, UniqueKey)):
+                match = keyed.pop(child._key, None)
+            else:
+                match = next(unkeyed, None)
+            # a widget of another type could not be reused anyway
+            if match is not None and \
+                    type(old._children[match]) is not type(child):
+                match = None
+            matches.append(match)
+        # drop the leftovers first, new children may pick them up again
+        for i in set(range(len(old._children))).difference(matches):
+            self._layout.removeWidget(previous[i])
+            old._children[i].disposeWidget(previous[i])
+        for child, match in zip(self._children, matches):
+            if match is None:
+                self._widgets.append(child.paintWidget())
+                continue
+            reused = _reconcileWidget(
+                old._children[match], child, previous[match])
+            if reused is not previous[match]:
+                self._layout.removeWidget(previous[match])
+                old._children[match].disposeWidget(previous[match])
+            self._widgets.append(reused)
+        # Qt moves widgets already in the layout without re-creating them
+        for i, child in enumerate(self._children):
+            if isinstance(child, Expanded):
+                flex = child._flex
+            else:
+                flex = 0
+            item = self._layout.itemAt(i)
+            if item is not None and item.widget() is self._widgets[i]:
+                self._layout.setStretch(i, flex)
+                continue
+            self._layout.removeWidget(self._widgets[i])
+            self._layout.insertWidget(i, self._widgets[i], flex)
+        return self._widget
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        super(AxisAlignedBox, self).adoptWidget(old, widget)
+        self._layout = widget.layout()
+        self._widgets = []
+        # the children may still not be able to adopt theirs
+        for i, child in enumerate(self._children):
+            self._widgets.append(
+                _reconcile(old._children[i], child, self._layout, i))
+        return
     pass
 
 
-class Column(Widget):
-    """ Vertical alignment, wraps AxisAlignedBox. """
-    def __init__(self, key: Key = Key(), children: List[Widget] = [],
+class Column(AxisAlignedBox):
+    """ Vertical alignment, an AxisAlignedBox laid out vertically. """
+    __slots__ = ()
+    _TAG = 6
+
+    def __init__(self, key: Key = Key(),
+                 children: Optional[List[Widget]] = None,
                  alignment: Alignment = Alignment.none):
-        super(Column, self).__init__(key)
-        self._children = children
-        self._alignment = alignment
+        super(Column, self).__init__(
+            key=key, children=children, vertical=True, alignment=alignment)
         return
+    pass
+
+
+class Row(AxisAlignedBox):
+    """ Horizontal alignment, an AxisAlignedBox laid out horizontally. """
+    __slots__ = ()
+    _TAG = 7
+
+    def __init__(self, key: Key = Key(),
+                 children: Optional[List[Widget]] = None,
+                 alignment: Alignment = Alignment.none):
+        super(Row, self).__init__(
+            key=key, children=children, vertical=False, alignment=alignment)
+        return
+    pass
+
+
+class InheritedWidget(Widget):
+    """ Holds a slice of the state for the widgets below. Subclass it for each
+    slice, and read it from a Builder with
+    context.dependOnInheritedWidgetOfExactType(). Changing it through
+    context.setState(slice=...) then rebuilds only those Builders. The value
+    given here is the initial one, a value set that way replaces it in later
+    builds until they pass another initial value. """
+    __slots__ = ('_value', '_initial', '_child', '_dependents')
+    _TAG = 10
+    _counter = itertools.count()
+
+    def __init__(self, key: Key = Key(), value: Any = None,
+                 child: Widget = None):
+        super(InheritedWidget, self).__init__(key)
+        if child is None:
+            raise ValueError('InheritedWidget must have a non-null child')
+        self._value = value
+        self._initial = value
+        self._child = child
+        self._dependents = weakref.WeakSet()
+        return
+
+    @property
+    def value(self) -> Any:
+        return self._value
+
+    def updateShouldNotify(self, old: Any) -> bool:
+        """ Whether the dependents are to be rebuilt, now that the value has
+        been changed from `old`. """
+        return self._value != old
 
     def build(self, context: BuildContext):
-        super(Column, self).build(context)
-        self._child = AxisAlignedBox(
-            children=self._children,
-            vertical=True,
-            alignment=self._alignment
-        )
+        super(InheritedWidget, self).build(context)
+        for initial, value in context._values.get(type(self), ()):
+            if initial == self._initial:
+                self._value = value
+                break
+        context._slices.setdefault(type(self), weakref.WeakSet()).add(self)
+        context._inherited.append(self)
         self._child.build(context)
-        self._hash = hash('Column(%d)' % self._child._hash)
+        context._inherited.pop()
+        # the value may change in place, so never let it pass for unchanged
+        self._hash = hash((InheritedWidget._TAG, next(self._counter)))
         return
 
     def paintWidget(self) -> Any:
-        return self._child.paintWidget()
+        self._widget = self._child.paintWidget()
+        return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = _reconcileWidget(old._child, self._child, widget)
+        return self._widget
+
+    def disposeWidget(self, widget: Any) -> None:
+        self._child.disposeWidget(widget)
+        return
     pass
 
 
-class Row(Widget):
-    """ Horizontal alignment, wraps AxisAlignedBox. """
-    def __init__(self, key: Key = Key(), children: List[Widget] = [],
-                 alignment: Alignment = Alignment.none):
-        super(Row, self).__init__(key)
-        self._children = children
-        self._alignment = alignment
+class Builder(Widget):
+    """ Builds its child by calling builder(context), at build time and again
+    whenever an InheritedWidget it depends on changes, or it is told to
+    setState() itself. """
+    __slots__ = ('_builder', '_child', '_shown', '_layout', '_scope')
+    _TAG = 11
+    _counter = itertools.count()
+
+    def __init__(self, key: Key = Key(),
+                 builder: Callable[[BuildContext], Widget] = None):
+        super(Builder, self).__init__(key)
+        if builder is None:
+            raise ValueError('Builder must have a non-null builder')
+        self._builder = builder
+        # the child that the container shows, build() replaces _child first
+        self._shown = None
+        self._layout = None
         return
 
     def build(self, context: BuildContext):
-        super(Row, self).build(context)
-        self._child = AxisAlignedBox(
-            children=self._children,
-            vertical=False,
-            alignment=self._alignment
-        )
+        super(Builder, self).build(context)
+        self._scope = (tuple(context._inherited), tuple(context._building))
+        context._building.append(self)
+        self._child = self._builder(context)
         self._child.build(context)
-        self._hash = hash('Row(%d)' % self._child._hash)
+        context._building.pop()
+        # the child may be rebuilt in place, as with InheritedWidget
+        self._hash = hash((Builder._TAG, next(self._counter)))
+        return
+
+    def rebuild(self) -> None:
+        """ Rebuilds this widget alone, and repaints what changed. """
+        if self._layout is None or PyQt5.sip.isdeleted(self._layout):
+            return  # replaced or discarded since
+        context = self._context
+        saved = (context._inherited, context._building)
+        context._inherited = list(self._scope[0])
+        context._building = list(self._scope[1])
+        self.build(context)
+        context._inherited, context._building = saved
+        _reconcile(self._shown, self._child, self._layout, 0)
+        _dropSpares()
+        self._shown = self._child
+        return
+
+    def setState(self) -> None:
+        if self._context is None:
+            print('attempted setState() on an unbuilt widget')
+            return
+        self._context.markNeedsBuild(self)
         return
 
     def paintWidget(self) -> Any:
-        return self._child.paintWidget()
+        # a container of its own, so the child can be swapped in place
+        self._layout = PyQt5.QtWidgets.QHBoxLayout()
+        self._layout.setContentsMargins(0, 0, 0, 0)
+        self._layout.addWidget(self._child.paintWidget())
+        self._shown = self._child
+        self._widget = PyQt5.QtWidgets.QWidget()
+        self._widget.setLayout(self._layout)
+        return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = widget
+        self._mount(old)
+        return self._widget
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        super(Builder, self).adoptWidget(old, widget)
+        self._mount(old)
+        return
+
+    def _mount(self, old: Widget) -> None:
+        """ Takes the container over from `old`, which may be this very
+        widget, and brings what it shows up to date with the child. """
+        self._layout = self._widget.layout()
+        shown = old._shown
+        if old is not self:
+            old._layout = None
+            old._shown = None
+        _reconcile(shown, self._child, self._layout, 0)
+        self._shown = self._child
+        return
+    pass
+
+
+class TableData:
+    """ Contents of a TableView. The hash is kept up to date as cells are
+    changed, so a table that is kept across builds is never traversed again
+    just to find out whether it changed. Cells are hashed as displayed, so
+    that e.g. 1 and 1.0 tell apart, and need not be hashable. """
+    def __init__(self, data: Optional[List[List[Any]]] = None):
+        if data is None:
+            data = ()
+        self._data = []
+        self._hash = 0
+        for row, items in enumerate(data):
+            self._data.append(list(items))
+            for col, value in enumerate(items):
+                self._hash ^= hash((row, col, str(value)))
+        return
+
+    def getitem(self, row: int, col: int) -> str:
+        """ Returns the cell as displayed, empty if out of range. """
+        data = ''
+        if row < len(self._data):
+            if col < len(self._data[row]):
+                data = str(self._data[row][col])
+        return data
+
+    def setitem(self, row: int, col: int, value: Any) -> None:
+        """ Sets the cell, padding the table with empty cells if needed. """
+        while len(self._data) <= row:
+            self._data.append([])
+        items = self._data[row]
+        while len(items) <= col:
+            self._hash ^= hash((row, len(items), ''))
+            items.append('')
+        self._hash ^= hash((row, col, str(items[col])))
+        items[col] = value
+        self._hash ^= hash((row, col, str(value)))
+        return
     pass
 
 
 class TableView(Widget):
-    """ A table showing items. The callback functions are:
-    onSelect(row, col, oldData), onChanged(row, col, newData). """
+    """ A table showing items, from a list of rows or a TableData. The
+    callback functions are: onSelect(row, col, oldData),
+    onChanged(row, col, newData). """
+    __slots__ = ('_rows', '_cols', '_headers', '_data', '_onselected',
+                 '_onchanged', '_filled')
+    _TAG = 8
+
     def __init__(self, key: Key = Key(), rows: int = 1, columns: int = 1,
-                 headers: List[str] = [], data: List[List[str]] = [],
+                 headers: Optional[List[str]] = None,
+                 data: Union[TableData, List[List[str]], None] = None,
                  onSelected: Callable[[int, int, str], Any] = None,
                  onChanged: Callable[[int, int, str], Any] = None):
         super(TableView, self).__init__(key)
         self._rows = rows
         self._cols = columns
+        if headers is None:
+            headers = []
         self._headers = headers
+        if not isinstance(data, TableData):
+            data = TableData(data)
         self._data = data
         self._onselected = onSelected
         self._onchanged = onChanged
+        # hash of what the Qt widget was last filled with
+        self._filled = None
         return
 
     def build(self, context: BuildContext):
         super(TableView, self).build(context)
-        self._hash = hash('TableView(rows=%d,columns=%d,data=%s)' % (
-            self._rows, self._cols, str(self._data)))
+        self._hash = hash((TableView._TAG, self._rows, self._cols,
+                           tuple(self._headers), self._data._hash))
         return
 
     def _getdataitem(self, row: int, col: int) -> str:
-        data = ''
-        if row < len(self._data):
-            if col < len(self._data[row]):
-                data = str(self._data[row][col])
-        return data
+        return self._data.getitem(row, col)
 
     def paintWidget(self) -> Any:
         self._widget = PyQt5.QtWidgets.QTableWidget()
+        # cells are cloned from the prototype rather than constructed anew
+        self._widget.setItemPrototype(PyQt5.QtWidgets.QTableWidgetItem())
+        self._fill()
+        self._widget.cellClicked.connect(self._cellClicked)
+        self._widget.cellChanged.connect(self._cellChanged)
+        return self._widget
+
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = widget
+        # kept across builds, only traverse it when its TableData changed
+        if old is not self or self._filled != self._hash:
+            self._fill()
+        _rebind(self._widget.cellClicked, old._cellClicked, self._cellClicked)
+        _rebind(self._widget.cellChanged, old._cellChanged, self._cellChanged)
+        return self._widget
+
+    def _fill(self) -> None:
+        """ Brings the cells and headers of the Qt widget up to date. Items
+        that exist are changed in place and only if their text differs, so
+        cells that kept their content never touch Qt. """
+        self._widget.setUpdatesEnabled(False)
+        self._widget.blockSignals(True)
         self._widget.setRowCount(self._rows)
         self._widget.setColumnCount(self._cols)
-        # set data values
+        prototype = self._widget.itemPrototype()
+        # compare against the Qt items, which the user may also have edited
         for row in range(self._rows):
             for col in range(self._cols):
                 data = self._getdataitem(row, col)
-                self._widget.setItem(
-                    row, col, PyQt5.QtWidgets.QTableWidgetItem(data))
+                item = self._widget.item(row, col)
+                if item is None:
+                    item = prototype.clone()
+                    item.setText(data)
+                    self._widget.setItem(row, col, item)
+                elif item.text() != data:
+                    item.setText(data)
                 pass
             pass
-        # set headers
         for i in range(self._cols):
             head = str(self._headers[i] if i < len(self._headers) else i + 1)
-            self._widget.setHorizontalHeaderItem(
-                i, PyQt5.QtWidgets.QTableWidgetItem(head))
-
-        def onSelect(row, col):
-            if self._onselected is not None:
-                self._onselected(row, col, self._getdataitem(row, col))
-
-        def onChanged(row, col):
-            model = self._widget.model()
-            idx = model.index(row, col)
-            data = model.data(idx)
-            if self._onchanged is not None:
-                self._onchanged(row, col, data)
-        self._widget.cellClicked.connect(onSelect)
-        self._widget.cellChanged.connect(onChanged)
-        return self._widget
+            item = self._widget.horizontalHeaderItem(i)
+            if item is None:
+                item = prototype.clone()
+                item.setText(head)
+                self._widget.setHorizontalHeaderItem(i, item)
+            elif item.text() != head:
+                item.setText(head)
+        self._widget.blockSignals(False)
+        self._widget.setUpdatesEnabled(True)
+        self._filled = self._hash
+        return
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        super(TableView, self).adoptWidget(old, widget)
+        self._filled = old._filled
+        _rebind(self._widget.cellClicked, old._cellClicked, self._cellClicked)
+        _rebind(self._widget.cellChanged, old._cellChanged, self._cellChanged)
+        return
+
+    def _cellClicked(self, row: int, col: int) -> None:
+        if self._onselected is not None:
+            self._onselected(row, col, self._getdataitem(row, col))
+        return
+
+    def _cellChanged(self, row: int, col: int) -> None:
+        model = self._widget.model()
+        idx = model.index(row, col)
+        data = model.data(idx)
+        if self._onchanged is not None:
+            self._onchanged(row, col, data)
+        return
     pass
 
 
 class DropdownList(Widget):
     """ A dropdown list that you can choose items from. """
-    def __init__(self, key: Key = Key(), items: List[str] = [], index: int = 0,
-                 onChanged: Callable[[int, str], Any] = None):
+    __slots__ = ('_items', '_items_hash', '_index', '_onchanged', '_spare')
+    _TAG = 9
+
+    def __new__(cls, key: Key = Key(), items: Optional[List[str]] = None,
+                index: int = 0, onChanged: Callable[[int, str], Any] = None):
+        if items is None:
+            items = ()
+        items = tuple(str(item) for item in items)
+        instance = _intern(cls, key, (items, index, onChanged))
+        if not hasattr(instance, '_hash'):
+            # handed over to __init__, so the items are only walked once
+            instance._items = items
+        return instance
+
+    def __init__(self, key: Key = Key(), items: Optional[List[str]] = None,
+                 index: int = 0, onChanged: Callable[[int, str], Any] = None):
+        if hasattr(self, '_hash'):
+            return  # interned, already initialized
         super(DropdownList, self).__init__(key)
-        self._items = []
-        for item in items:
-            self._items.append(str(item))
+        # self._items was set by __new__
+        self._items_hash = hash(self._items)
         self._index = index
         self._onchanged = onChanged
-        return
-
-    def build(self, context: BuildContext):
-        super(DropdownList, self).build(context)
-        self._hash = hash('DropdownList(items=%s)' % ','.join(
-            str(hash(i)) for i in self._items))
+        self._spare = None
+        self._hash = hash((DropdownList._TAG, self._items_hash, self._index))
         return
 
     def paintWidget(self) -> Any:
+        if self._spare is not None:
+            self._widget, self._spare = self._spare, None
+            self._widget.blockSignals(True)
+            self._widget.setCurrentIndex(self._index)
+            self._widget.blockSignals(False)
+            return self._widget
         self._widget = PyQt5.QtWidgets.QComboBox()
         for item in self._items:
             self._widget.addItem(item)
         self._widget.setCurrentIndex(self._index)
+        self._widget.currentIndexChanged.connect(self._selected)
+        return self._widget
 
-        def onSelected(i):
-            if self._onchanged is not None:
-                self._onchanged(i, self._items[i])
-        self._widget.currentIndexChanged.connect(onSelected)
+    def updateWidget(self, old: Widget, widget: Any) -> Any:
+        self._widget = widget
+        # repopulating must not look like the user picking an item
+        self._widget.blockSignals(True)
+        if self._items_hash != old._items_hash or self._items != old._items:
+            self._widget.clear()
+            for item in self._items:
+                self._widget.addItem(item)
+        self._widget.setCurrentIndex(self._index)
+        self._widget.blockSignals(False)
+        _rebind(self._widget.currentIndexChanged, old._selected,
+                self._selected)
         return self._widget
+
+    def adoptWidget(self, old: Widget, widget: Any) -> None:
+        super(DropdownList, self).adoptWidget(old, widget)
+        _rebind(self._widget.currentIndexChanged, old._selected,
+                self._selected)
+        return
+
+    def disposeWidget(self, widget: Any) -> None:
+        # interned, so painting it again in this pass may pick it up
+        if self._spare is not None:
+            return super(DropdownList, self).disposeWidget(widget)
+        widget.setParent(None)
+        self._spare = widget
+        _spares.append(self)
+        return
+
+    def _selected(self, i: int) -> None:
+        if self._onchanged is not None:
+            self._onchanged(i, self._items[i])
+        return
     pass
 
 
+# Qt allows one QApplication per process, it is shared by all Applications
+_qapplication = None
+
+
 class Application:
     def __init__(self, context: Union[BuildContext, None] = None,
                  builder: Callable[[BuildContext], Widget] = None,
@@ -442,31 +1063,45 @@ class Application:
         return
 
     def setState(self) -> None:
+        if self._widget is None:
+            return  # not shown yet, run() builds the tree afresh
         newState = self._builder(self._context)
         newState.build(self._context)
-        oldWidget = self._layout.takeAt(0)
-        oldWidget.widget().deleteLater()
-        widget = newState.paintWidget()
-        self._layout.addWidget(widget)
+        # only the subtrees that changed since last time are repainted
+        _reconcile(self._state, newState, self._layout, 0)
+        _dropSpares()
+        self._state = newState
         return
 
     def run(self) -> None:
+        global _qapplication
         if self._running:
             return
-        self._state = self._builder(self._context)
-        self._state.build(self._context)
-        self._application = PyQt5.QtWidgets.QApplication([])
-        self._widget = PyQt5.QtWidgets.QWidget()
-        self._layout = PyQt5.QtWidgets.QHBoxLayout()
-        widget = self._state.paintWidget()
-        self._layout.addWidget(widget)
-        self._widget.setLayout(self._layout)
-        self._widget.setWindowTitle(self._title)
-        if self._windowsize[0] is not None and self._windowsize[1] is not None:
-            _width, _height = self._windowsize
-            self._widget.resize(_width, _height)
+        if _qapplication is None:
+            _qapplication = PyQt5.QtWidgets.QApplication.instance()
+        if _qapplication is None:
+            _qapplication = PyQt5.QtWidgets.QApplication([])
+        self._application = _qapplication
+        if self._widget is None:
+            self._state = self._builder(self._context)
+            self._state.build(self._context)
+            self._widget = PyQt5.QtWidgets.QWidget()
+            self._layout = PyQt5.QtWidgets.QHBoxLayout()
+            widget = self._state.paintWidget()
+            self._layout.addWidget(widget)
+            self._widget.setLayout(self._layout)
+            self._widget.setWindowTitle(self._title)
+            if self._windowsize[0] is not None and \
+                    self._windowsize[1] is not None:
+                _width, _height = self._windowsize
+                self._widget.resize(_width, _height)
+        else:
+            # shown before, bring the window we have up to date
+            self.setState()
         self._widget.show()
+        self._running = True
         self._application.exec_()
+        self._running = False
         return
     pass
 
@@ -486,6 +1121,28 @@ class MessageBoxButtons(enum.Enum):
     close = 3
 
 
+_qmb = PyQt5.QtWidgets.QMessageBox
+_messagebox_icons = {
+    MessageBoxIcon.question: _qmb.Question,
+    MessageBoxIcon.info: _qmb.Information,
+    MessageBoxIcon.warning: _qmb.Warning,
+    MessageBoxIcon.critical: _qmb.Critical,
+}
+_messagebox_buttons = {
+    MessageBoxButtons.ok: _qmb.Ok,
+    MessageBoxButtons.okCancel: _qmb.Ok | _qmb.Cancel,
+    MessageBoxButtons.yesNo: _qmb.Yes | _qmb.No,
+    MessageBoxButtons.close: _qmb.Close,
+}
+_messagebox_button_ids = {
+    _qmb.Ok: 'ok',
+    _qmb.Cancel: 'cancel',
+    _qmb.Yes: 'yes',
+    _qmb.No: 'no',
+    _qmb.Close: 'close',
+}
+
+
 def showMessageBox(title: str = 'Message box', text: str = 'Message box',
                    icon: MessageBoxIcon = MessageBoxIcon.none,
                    buttons: MessageBoxButtons = MessageBoxButtons.ok,
@@ -494,43 +1151,14 @@ def showMessageBox(title: str = 'Message box', text: str = 'Message box',
     msg = PyQt5.QtWidgets.QMessageBox()
     msg.setWindowTitle(title)
     msg.setText(text)
-    qmb = PyQt5.QtWidgets.QMessageBox
     if icon != MessageBoxIcon.none:
-        msg.setIcon({
-            MessageBoxIcon.question: qmb.Question,
-            MessageBoxIcon.info: qmb.Information,
-            MessageBoxIcon.warning: qmb.Warning,
-            MessageBoxIcon.critical: qmb.Critical,
-        }[icon])
-    _buttons = []
+        msg.setIcon(_messagebox_icons[icon])
 
     def foo(button):
-        if button == _buttons[0]:
-            bid = {
-                MessageBoxButtons.ok: 'ok',
-                MessageBoxButtons.okCancel: 'ok',
-                MessageBoxButtons.yesNo: 'yes',
-                MessageBoxButtons.close: 'close',
-            }[buttons]
-        else:
-            bid = {
-                MessageBoxButtons.okCancel: 'cancel',
-                MessageBoxButtons.yesNo: 'no',
-            }[buttons]
+        bid = _messagebox_button_ids[msg.standardButton(button)]
         if onTap is not None:
             onTap(bid)
-    if buttons == MessageBoxButtons.ok:
-        msg.setStandardButtons(qmb.Ok)
-        msg.buttonClicked.connect(foo)
-    elif buttons == MessageBoxButtons.okCancel:
-        msg.setStandardButtons(qmb.Ok | qmb.Cancel)
-        msg.buttonClicked.connect(foo)
-    elif buttons == MessageBoxButtons.yesNo:
-        msg.setStandardButtons(qmb.Yes | qmb.No)
-        msg.buttonClicked.connect(foo)
-    elif buttons == MessageBoxButtons.close:
-        msg.setStandardButtons(qmb.Close)
-        msg.buttonClicked.connect(foo)
-    _buttons = msg.buttons()
+    msg.setStandardButtons(_messagebox_buttons[buttons])
+    msg.buttonClicked.connect(foo)
     msg.exec_()
     return